@@ -0,0 +1,66 @@
+"""add news_articles.published_at and feed indexes
+
+Revision ID: 3f2a9c1d7b64
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from article_parser import news_published_at
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f2a9c1d7b64"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {c["name"] for c in inspector.get_columns("news_articles")}
+
+    # databases created by create_all already have the new schema
+    if "published_at" not in columns:
+        with op.batch_alter_table("news_articles") as batch_op:
+            batch_op.add_column(sa.Column("published_at", sa.DateTime(), nullable=True))
+
+        news_articles = sa.table(
+            "news_articles",
+            sa.column("id", sa.Integer),
+            sa.column("time", sa.String),
+            sa.column("published_at", sa.DateTime),
+        )
+        rows = bind.execute(sa.select(news_articles.c.id, news_articles.c.time)).all()
+        for article_id, time in rows:
+            bind.execute(
+                news_articles.update()
+                .where(news_articles.c.id == article_id)
+                .values(published_at=news_published_at(time))
+            )
+
+        with op.batch_alter_table("news_articles") as batch_op:
+            batch_op.alter_column("published_at", existing_type=sa.DateTime(), nullable=False)
+
+    indexes = {i["name"] for i in inspector.get_indexes("news_articles")}
+    if "ix_news_articles_published_at_id" not in indexes:
+        op.create_index(
+            "ix_news_articles_published_at_id", "news_articles", ["published_at", "id"]
+        )
+    indexes = {i["name"] for i in inspector.get_indexes("user_news_upvotes")}
+    if "ix_user_news_upvotes_news_articles_id" not in indexes:
+        op.create_index(
+            "ix_user_news_upvotes_news_articles_id", "user_news_upvotes", ["news_articles_id"]
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_news_upvotes_news_articles_id", table_name="user_news_upvotes")
+    op.drop_index("ix_news_articles_published_at_id", table_name="news_articles")
+    with op.batch_alter_table("news_articles") as batch_op:
+        batch_op.drop_column("published_at")
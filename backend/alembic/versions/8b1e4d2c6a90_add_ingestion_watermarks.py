@@ -0,0 +1,34 @@
+"""add ingestion_watermarks
+
+Revision ID: 8b1e4d2c6a90
+Revises: 3f2a9c1d7b64
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b1e4d2c6a90"
+down_revision: Union[str, None] = "3f2a9c1d7b64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # databases created by create_all already have the table
+    if "ingestion_watermarks" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "ingestion_watermarks",
+        sa.Column("search_term", sa.String(), primary_key=True),
+        sa.Column("newest_url", sa.String(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ingestion_watermarks")
@@ -0,0 +1,45 @@
+"""add news_articles.upvote_count
+
+Revision ID: c5d7e9f1a3b2
+Revises: 8b1e4d2c6a90
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d7e9f1a3b2"
+down_revision: Union[str, None] = "8b1e4d2c6a90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("news_articles")}
+    if "upvote_count" not in columns:
+        with op.batch_alter_table("news_articles") as batch_op:
+            batch_op.add_column(
+                sa.Column("upvote_count", sa.Integer(), nullable=False, server_default="0")
+            )
+
+    news_articles = sa.table(
+        "news_articles", sa.column("id", sa.Integer), sa.column("upvote_count", sa.Integer)
+    )
+    upvotes = sa.table("user_news_upvotes", sa.column("news_articles_id", sa.Integer))
+    bind.execute(
+        news_articles.update().values(
+            upvote_count=sa.select(sa.func.count())
+            .where(upvotes.c.news_articles_id == news_articles.c.id)
+            .scalar_subquery()
+        )
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("news_articles") as batch_op:
+        batch_op.drop_column("upvote_count")
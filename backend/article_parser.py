@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import lxml.html
+
+# udn article page elements, matched on one class of their class attribute
+TITLE_XPATH = "//h1[contains(concat(' ', normalize-space(@class), ' '), ' article-content__title ')]"
+TIME_XPATH = "//time[contains(concat(' ', normalize-space(@class), ' '), ' article-content__time ')]"
+EDITOR_XPATH = (
+    "//section[contains(concat(' ', normalize-space(@class), ' '), ' article-content__editor ')]"
+)
+
+
+def _first(tree, xpath):
+    elements = tree.xpath(xpath)
+    if not elements:
+        raise ValueError(f"not an udn article page, {xpath} not found")
+    return elements[0]
+
+
+def parse_article_html(html):
+    """
+    parse an udn article page, only the title, time and editor section are
+    read out of the lxml tree
+
+    :param html: article page html
+    :return: (title, time, paragraphs)
+    :raise ValueError: when the page has no udn article
+    """
+    tree = lxml.html.fromstring(html)
+    # 標題
+    title = _first(tree, TITLE_XPATH).text_content()
+    time = _first(tree, TIME_XPATH).text_content()
+    # 定位到包含文章内容的 <section>
+    content_section = _first(tree, EDITOR_XPATH)
+
+    paragraphs = []
+    for p in content_section.iter("p"):
+        text = p.text_content()
+        if text.strip() != "" and "▪" not in text:
+            paragraphs.append(text)
+    return title, time, paragraphs
+
+
+NEWS_TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y/%m/%d %H:%M")
+
+
+def parse_news_time(value):
+    """
+    parse the udn display time, e.g. '2024-07-02 21:44'
+
+    :param value:
+    :return: datetime, or None when the format is unknown
+    """
+    for fmt in NEWS_TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+def news_published_at(value):
+    """
+    :param value: udn display time
+    :return: the parsed time, or now when the format is unknown
+    """
+    return parse_news_time(value) or datetime.now()
@@ -0,0 +1,48 @@
+"""
+compare the udn article extraction of article_parser against the previous
+BeautifulSoup html.parser implementation on the saved fixture pages
+
+usage (from backend/): python benchmarks/bench_article_parser.py [rounds]
+"""
+import os
+import sys
+import timeit
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from article_parser import parse_article_html  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+
+
+def parse_article_html_bs4(html):
+    """the extraction previously inlined in main.py"""
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.find("h1", class_="article-content__title").text
+    time = soup.find("time", class_="article-content__time").text
+    content_section = soup.find("section", class_="article-content__editor")
+    paragraphs = [
+        p.text
+        for p in content_section.find_all("p")
+        if p.text.strip() != "" and "▪" not in p.text
+    ]
+    return title, time, paragraphs
+
+
+def main(rounds=200):
+    pages = [path.read_text(encoding="utf-8") for path in sorted(FIXTURES.glob("udn_article_*.html"))]
+    for html in pages:
+        assert parse_article_html(html) == parse_article_html_bs4(html)
+
+    results = {}
+    for name, parse in (("bs4 html.parser", parse_article_html_bs4), ("lxml", parse_article_html)):
+        seconds = timeit.timeit(lambda: [parse(html) for html in pages], number=rounds)
+        results[name] = seconds / (rounds * len(pages)) * 1000
+        print(f"{name:16} {results[name]:8.3f} ms / page")
+    print(f"speedup {results['bs4 html.parser'] / results['lxml']:.1f}x over {len(pages)} pages")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,120 @@
+import gzip
+import threading
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+# preferred first
+ENCODINGS = ("br", "gzip")
+# smaller bodies are sent as is, compressing them does not pay off
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+# 11 is the densest but several times slower, 5 is close to gzip -9 speed
+BROTLI_QUALITY = 5
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    :param accept_encoding: Accept-Encoding request header, e.g. "gzip, br;q=0.8"
+    :return: "br", "gzip" or None for identity
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    candidates = [
+        e for e in ENCODINGS if accepted.get(e, accepted.get("*", 0.0)) > 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda e: accepted.get(e, accepted.get("*", 0.0)))
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class PrecompressedBody:
+    """
+    a response body whose compressed variants are computed once, on first
+    use, and reused for every later request
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def get(self, encoding):
+        """
+        :param encoding: "br", "gzip" or None
+        :return: (body, encoding actually applied)
+        """
+        if encoding is None or len(self.body) < COMPRESSION_MIN_SIZE:
+            return self.body, None
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = compress(self.body, encoding)
+            return self._encoded[encoding], encoding
+
+
+class CompressionMiddleware:
+    """
+    compress the responses of at least minimum_size bytes with brotli or gzip
+    as negotiated by Accept-Encoding, streamed responses and responses that
+    already carry a Content-Encoding are left untouched
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                body = message.get("body", b"")
+                if (
+                    "content-encoding" in headers
+                    or message.get("more_body", False)
+                    or len(body) < self.minimum_size
+                ):
+                    passthrough = True
+                else:
+                    body = compress(body, encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+                await send(start_message)
+                start_message = None
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
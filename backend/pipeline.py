@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+# end of input marker, one per worker of a stage
+_DONE = object()
+
+
+class Stage:
+    """
+    a pipeline step applying fn to each item on its own worker threads
+
+    fn returns the item for the next stage, or None to drop it. A call that
+    raises is retried up to retries times with exponential backoff, after
+    which the item is recorded as an error and dropped without affecting the
+    other items.
+    """
+
+    def __init__(self, name, fn, workers=1, retries=0, backoff=0.5, retry_on=(Exception,)):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = retry_on
+
+    def call(self, arg):
+        attempt = 0
+        while True:
+            try:
+                return self.fn(arg)
+            except self.retry_on:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    def process(self, buffer, item, emit):
+        emit(self.call(item), [item])
+
+    def flush(self, buffer, emit):
+        pass
+
+    def new_buffer(self):
+        return None
+
+
+class BatchStage(Stage):
+    """
+    a pipeline step applying fn to batches of up to batch_size items, fn
+    returns the list of items for the next stage. A failing batch is retried
+    as a whole and its items are recorded as errors once retries run out.
+    """
+
+    def __init__(self, name, fn, batch_size, workers=1, retries=0, backoff=0.5, retry_on=(Exception,)):
+        super().__init__(name, fn, workers, retries, backoff, retry_on)
+        self.batch_size = batch_size
+
+    def process(self, buffer, item, emit):
+        buffer.append(item)
+        if len(buffer) >= self.batch_size:
+            self.flush(buffer, emit)
+
+    def flush(self, buffer, emit):
+        if buffer:
+            batch = list(buffer)
+            buffer.clear()
+            emit(self.call(batch), batch, many=True)
+
+    def new_buffer(self):
+        return []
+
+
+class StageStats:
+    def __init__(self):
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return {"processed": self.processed, "emitted": self.emitted, "errors": self.errors}
+
+
+class Pipeline:
+    """
+    stages connected by bounded queues, every stage runs its own workers so
+    the throughput is bound by the slowest stage and not by the sum of them
+    """
+
+    def __init__(self, stages, queue_size=100):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """
+        feed items through every stage and wait for the last one
+
+        :param items: input of the first stage
+        :return: (outputs of the last stage, errors as (stage name, item, exception),
+            stats of each stage by name)
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        outputs = []
+        errors = []
+        stats = {stage.name: StageStats() for stage in self.stages}
+        lock = threading.Lock()
+        running = [stage.workers for stage in self.stages]
+
+        def work(index):
+            stage = self.stages[index]
+            stage_stats = stats[stage.name]
+            buffer = stage.new_buffer()
+
+            def emit(result, inputs, many=False):
+                results = result if many else [result]
+                results = [r for r in results or () if r is not None]
+                with lock:
+                    stage_stats.processed += len(inputs)
+                    stage_stats.emitted += len(results)
+                for r in results:
+                    if index + 1 < len(self.stages):
+                        queues[index + 1].put(r)
+                    else:
+                        with lock:
+                            outputs.append(r)
+
+            def guarded(call, inputs):
+                try:
+                    call()
+                except Exception as e:
+                    print(f"pipeline: {stage.name} failed: {e!r}")
+                    with lock:
+                        stage_stats.errors += len(inputs)
+                        errors.extend((stage.name, item, e) for item in inputs)
+
+            while True:
+                item = queues[index].get()
+                if item is _DONE:
+                    break
+                if buffer is None:
+                    guarded(lambda: stage.process(buffer, item, emit), [item])
+                else:
+                    pending = list(buffer) + [item]
+                    guarded(lambda: stage.process(buffer, item, emit), pending)
+            if buffer:
+                pending = list(buffer)
+                guarded(lambda: stage.flush(buffer, emit), pending)
+
+            with lock:
+                running[index] -= 1
+                last_worker = running[index] == 0
+            if last_worker and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+        threads = [
+            threading.Thread(target=work, args=(index,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+            for index, stage in enumerate(self.stages)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for item in items:
+            queues[0].put(item)
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        return outputs, errors, {name: s.as_dict() for name, s in stats.items()}
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import threading
+import warnings
+from datetime import datetime
+from functools import cached_property
+
+import numpy as np
+import requests
+
+NECESSITIES_PRICE_URL = "https://opendata.ey.gov.tw/api/ConsumerProtection/NecessitiesPrice"
+PRODUCT_FIELDS = ("編號", "類別", "產品名稱", "規格")
+# months per period of each resolution
+RESOLUTIONS = {"month": 1, "quarter": 3, "year": 12}
+
+
+def month_ordinal(date_text):
+    """'2015-03-01' or '2015-03' -> months since year 0"""
+    return int(date_text[:4]) * 12 + int(date_text[5:7]) - 1
+
+
+def format_period(ordinal, resolution="month"):
+    year, month = divmod(ordinal, 12)
+    if resolution == "year":
+        return str(year)
+    if resolution == "quarter":
+        return f"{year}-Q{month // 3 + 1}"
+    return f"{year}-{month + 1:02d}"
+
+
+def parse_price_values(text):
+    """
+    parse a 統計值 string, the 0 markers of months without data become NaN
+
+    :param text: e.g. "144,143,0,145"
+    :return: float32 array, one value per month
+    """
+    values = np.array([v.strip() or "0" for v in text.split(",")], dtype=np.float32)
+    values[values == 0] = np.nan
+    return values
+
+
+def to_json_values(values):
+    """float array -> list with None for missing values"""
+    return [None if v != v else v for v in np.round(values.astype(np.float64), 2).tolist()]
+
+
+class PriceMatrix:
+    """
+    every product history parsed once into a (products x months) float32
+    matrix on a shared month axis, missing months are NaN
+    """
+
+    def __init__(self, items):
+        self.products = [{k: item.get(k) for k in PRODUCT_FIELDS} for item in items]
+        starts = [month_ordinal(item["時間起點"]) for item in items]
+        series = [parse_price_values(item.get("統計值") or "") for item in items]
+        self.start = min(starts, default=0)
+        end = max((s + len(v) for s, v in zip(starts, series)), default=self.start)
+        self.values = np.full((len(items), end - self.start), np.nan, dtype=np.float32)
+        for row, (start, values) in enumerate(zip(starts, series)):
+            offset = start - self.start
+            self.values[row, offset:offset + len(values)] = values
+
+    @property
+    def end(self):
+        """ordinal of the month after the last column"""
+        return self.start + self.values.shape[1]
+
+    def column_range(self, start=None, end=None):
+        """
+        :param start: first month 'YYYY-MM', inclusive
+        :param end: last month 'YYYY-MM', inclusive
+        :return: (first ordinal, ordinal after the last month) clipped to the matrix
+        """
+        first = self.start if start is None else max(month_ordinal(start), self.start)
+        last = self.end if end is None else min(month_ordinal(end) + 1, self.end)
+        return first, max(first, last)
+
+    def downsample(self, rows, first, last, resolution="month"):
+        """
+        average the months of each period, ignoring missing months
+
+        :return: (period ordinals, values of shape (len(rows), periods))
+        """
+        size = RESOLUTIONS[resolution]
+        block = self.values[rows, first - self.start:last - self.start]
+        if size == 1 or last <= first:
+            return np.arange(first, last, size), block[:, ::size]
+        # pad the block so it starts and ends on period boundaries
+        first_period, end_period = first - first % size, last + -last % size
+        block = np.pad(
+            block, ((0, 0), (first - first_period, end_period - last)), constant_values=np.nan
+        )
+        block = block.reshape(len(rows), (end_period - first_period) // size, size)
+        counts = np.count_nonzero(~np.isnan(block), axis=2)
+        sums = np.nansum(block, axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        return np.arange(first_period, end_period, size), means
+
+    def series(self, rows, start=None, end=None, resolution="month"):
+        """
+        ready to plot series of the given rows
+
+        :return: list of product dict with periods and values
+        """
+        first, last = self.column_range(start, end)
+        periods, values = self.downsample(rows, first, last, resolution)
+        labels = [format_period(p, resolution) for p in periods]
+        return [
+            {**self.products[row], "resolution": resolution, "periods": labels,
+             "values": to_json_values(row_values)}
+            for row, row_values in zip(rows, values)
+        ]
+
+    def forward_filled(self):
+        """values with each missing month replaced by the last known price"""
+        observed = ~np.isnan(self.values)
+        columns = np.where(observed, np.arange(self.values.shape[1]), -1)
+        np.maximum.accumulate(columns, axis=1, out=columns)
+        filled = np.take_along_axis(self.values, np.maximum(columns, 0), axis=1)
+        filled[columns < 0] = np.nan
+        return filled
+
+    def trends(self, window=3):
+        """
+        trend indicators of every product, computed in one pass over the matrix
+        and anchored at the last month with data of each product
+
+        :param window: months of the rolling mean
+        :return: dict of arrays, one value per product
+        """
+        n_rows, n_columns = self.values.shape
+        observed = ~np.isnan(self.values)
+        has_data = observed.any(axis=1)
+        last = n_columns - 1 - np.argmax(observed[:, ::-1], axis=1)
+
+        # trailing[:, k] is the price k months before the last month with data
+        span = max(13, window)
+        offsets = last[:, None] - np.arange(span)[None, :]
+        trailing = np.take_along_axis(self.forward_filled(), np.maximum(offsets, 0), axis=1)
+        trailing[(offsets < 0) | ~has_data[:, None]] = np.nan
+
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            latest = trailing[:, 0]
+            monthly_changes = trailing[:, :12] / trailing[:, 1:13] - 1
+            return {
+                "last_month": np.where(has_data, self.start + last, -1),
+                "latest": latest,
+                "mom_pct": (latest / trailing[:, 1] - 1) * 100,
+                "yoy_pct": (latest / trailing[:, 12] - 1) * 100,
+                "rolling_mean": np.nanmean(trailing[:, :window], axis=1),
+                "volatility_pct": np.nanstd(monthly_changes, axis=1) * 100,
+            }
+
+
+class PriceSnapshot:
+    """one immutable version of the necessities price dataset with its indexes"""
+
+    def __init__(self, items, updated_at):
+        self.items = items
+        self.updated_at = updated_at
+        self.by_category = {}
+        self.by_name = {}
+        self.by_id = {}
+        for i, item in enumerate(items):
+            self.by_category.setdefault(item.get("類別"), []).append(i)
+            self.by_name.setdefault(item.get("產品名稱"), []).append(i)
+            self.by_id.setdefault(str(item.get("編號")), i)
+        self._trends = {}
+        self._bodies = {}
+        digest = hashlib.sha256(
+            json.dumps(items, ensure_ascii=False, sort_keys=True).encode()
+        ).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+
+    @cached_property
+    def matrix(self):
+        return PriceMatrix(self.items)
+
+    def trends(self, window=3, top=5):
+        """
+        trend analytics of every product and the top movers of each category,
+        cached on the snapshot until the next refresh
+
+        :param window: months of the rolling mean
+        :param top: number of gainers and losers per category
+        :return: {"products": [...], "top_movers": {類別: {"gainers": [...], "losers": [...]}}}
+        """
+        key = (window, top)
+        if key not in self._trends:
+            self._trends[key] = self._build_trends(window, top)
+        return self._trends[key]
+
+    def _build_trends(self, window, top):
+        trends = self.matrix.trends(window)
+        columns = {name: to_json_values(values) for name, values in trends.items() if name != "last_month"}
+        products = []
+        for row, product in enumerate(self.matrix.products):
+            last_month = int(trends["last_month"][row])
+            products.append({
+                **product,
+                "last_month": format_period(last_month) if last_month >= 0 else None,
+                **{name: values[row] for name, values in columns.items()},
+            })
+
+        top_movers = {}
+        mom = trends["mom_pct"]
+        for category, rows in self.by_category.items():
+            rows = np.array(rows)
+            rows = rows[~np.isnan(mom[rows])]
+            ranked = rows[np.argsort(-mom[rows], kind="stable")]
+            top_movers[category] = {
+                "gainers": [self._mover(products[i]) for i in ranked[:top] if mom[i] > 0],
+                "losers": [self._mover(products[i]) for i in ranked[::-1][:top] if mom[i] < 0],
+            }
+        return {"window": window, "products": products, "top_movers": top_movers}
+
+    def response_body(self, key, render):
+        """
+        serialized response cached on the snapshot
+
+        :param key: identifies the response, e.g. its query parameters
+        :param render: builds the body on the first call
+        """
+        if key not in self._bodies:
+            self._bodies[key] = render()
+        return self._bodies[key]
+
+    @staticmethod
+    def _mover(product):
+        return {k: product[k] for k in ("編號", "產品名稱", "latest", "mom_pct")}
+
+    def find(self, category=None, commodity=None):
+        """
+        :param category: 類別
+        :param commodity: 產品名稱
+        :return: indexes of the matching items, in upstream order
+        """
+        if category is None and commodity is None:
+            return list(range(len(self.items)))
+        indexes = None
+        if category is not None:
+            indexes = set(self.by_category.get(category, ()))
+        if commodity is not None:
+            by_name = set(self.by_name.get(commodity, ()))
+            indexes = by_name if indexes is None else indexes & by_name
+        return sorted(indexes)
+
+    def query(self, category=None, commodity=None):
+        """
+        :param category: 類別
+        :param commodity: 產品名稱
+        :return: matching items, in upstream order
+        """
+        if category is None and commodity is None:
+            return self.items
+        return [self.items[i] for i in self.find(category, commodity)]
+
+
+class NecessitiesPriceStore:
+    """
+    in-memory copy of the opendata necessities price dataset, the upstream api
+    is only called by refresh
+    """
+
+    def __init__(self, url=NECESSITIES_PRICE_URL, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.snapshot = None
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self.snapshot is not None
+
+    def refresh(self):
+        """download the dataset and swap it in, the previous snapshot is kept on failure"""
+        with self._refresh_lock:
+            response = requests.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            self.load(response.json())
+
+    def load(self, items):
+        self.snapshot = PriceSnapshot(items, datetime.utcnow())
+
+    def get_snapshot(self):
+        """current snapshot, loaded from upstream on first use"""
+        if self.snapshot is None:
+            self.refresh()
+        return self.snapshot
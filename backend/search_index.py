@@ -0,0 +1,114 @@
+import re
+
+from sqlalchemy import text
+
+SEARCH_TABLE = "news_articles_fts"
+SEARCH_COLUMNS = ("title", "content", "summary", "reason")
+# bm25 weight of each of SEARCH_COLUMNS
+SEARCH_WEIGHTS = (3.0, 1.0, 2.0, 2.0)
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+CREATE_SEARCH_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    f"USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize='unicode61')"
+)
+
+
+def cjk_bigrams(value):
+    """
+    split text into search tokens, runs of CJK characters become overlapping
+    bigrams and other words are lowercased
+
+    :param value: e.g. "雞蛋價格 up"
+    :return: e.g. ["雞蛋", "蛋價", "價格", "up"]
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(value or ""):
+        run = match.group()
+        if not _CJK_RE.match(run):
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def build_match_query(query):
+    """
+    fts5 MATCH expression requiring every token of the query, a single CJK
+    character matches every bigram starting with it
+
+    :param query: user query
+    :return: MATCH expression, or None when the query has no token
+    """
+    terms = []
+    for token in cjk_bigrams(query):
+        if len(token) == 1 and _CJK_RE.match(token):
+            terms.append(f'"{token}"*')
+        else:
+            terms.append(f'"{token}"')
+    return " AND ".join(terms) or None
+
+
+def index_articles(connection, articles):
+    """
+    (re)index articles
+
+    :param connection: sqlite connection
+    :param articles: rows with id, title, content, summary and reason
+    """
+    articles = list(articles)
+    if not articles:
+        return
+    unindex_articles(connection, [a.id for a in articles])
+    connection.execute(
+        text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+            f"VALUES (:id, {', '.join(':' + c for c in SEARCH_COLUMNS)})"
+        ),
+        [
+            {"id": a.id, **{c: " ".join(cjk_bigrams(getattr(a, c))) for c in SEARCH_COLUMNS}}
+            for a in articles
+        ],
+    )
+
+
+def unindex_articles(connection, article_ids):
+    for article_id in article_ids:
+        connection.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": article_id}
+        )
+
+
+def rebuild_search_index(connection, articles):
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    index_articles(connection, articles)
+
+
+def count_indexed_articles(connection):
+    return connection.execute(text(f"SELECT count(*) FROM {SEARCH_TABLE}")).scalar()
+
+
+def search_article_ids(connection, query, limit, offset=0):
+    """
+    :param connection: sqlite connection
+    :param query: user query
+    :param limit:
+    :param offset:
+    :return: ids of the matching articles, best match first
+    """
+    match = build_match_query(query)
+    if match is None:
+        return []
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    return list(connection.execute(
+        text(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "limit": limit, "offset": offset},
+    ).scalars())
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# keep the app engine off news_database.db, must be set before main is imported
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def llm_cache(monkeypatch, tmp_path):
+    """give every test an empty llm response cache"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'llm_cache.db'}")
+    main.LLMResponseCacheEntry.__table__.create(engine)
+    cache = main.LLMResponseCache(
+        sessionmaker(bind=engine), main.LLM_CACHE_TTL, main.LLM_CACHE_MAX_ENTRIES
+    )
+    monkeypatch.setattr(main, "llm_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def feed_cache(monkeypatch):
+    """test fixtures write news behind the api, start every test with an empty feed cache"""
+    cache = main.FeedCache(main.FEED_CACHE_TTL, main.FEED_CACHE_MAX_ENTRIES)
+    monkeypatch.setattr(main, "feed_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def auth_user_cache(monkeypatch):
+    """users are cleared between test modules, never reuse a resolved user"""
+    cache = main.AuthUserCache(main.AUTH_CACHE_TTL, main.AUTH_CACHE_MAX_ENTRIES)
+    monkeypatch.setattr(main, "auth_user_cache", cache)
+    return cache
@@ -1,14 +1,23 @@
+import asyncio
+
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, StaticPool
+from sqlalchemy import create_engine, event, StaticPool
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+import httpx
 import json
+from datetime import datetime
 from jose import jwt
 from main import app
 from main import Base, NewsArticle, User, session_opener, user_news_association_table
 from main import NewsSumaryRequestSchema, PromptRequest
 from main import pwd_context
+from article_parser import news_published_at, parse_news_time
 from unittest.mock import Mock
+import main
 
 
 SECRET_KEY = "1892dhianiandowqd0n"
@@ -27,7 +36,17 @@ def override_session_opener():
         db.close()
 
 
-app.dependency_overrides[session_opener] = override_session_opener
+# a new event loop serves every TestClient request, so connections are not pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def override_async_session_opener():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+app.dependency_overrides[session_opener] = override_async_session_opener
 client = TestClient(app)
 
 @pytest.fixture(scope="module")
@@ -108,8 +127,54 @@ def test_read_user_news(test_user, test_token, test_articles):
     assert json_response[1]["title"] == "Test News 1"
     assert json_response[1]["is_upvoted"] is False
 
+def test_read_news_pagination(test_articles):
+    response = client.get("/api/v1/news/news", params={"limit": 1})
+    assert response.status_code == 200
+    assert [n["title"] for n in response.json()] == ["Test News 2"]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get("/api/v1/news/news", params={"limit": 1, "cursor": cursor})
+    assert response.status_code == 200
+    assert [n["title"] for n in response.json()] == ["Test News 1"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_read_news_invalid_cursor():
+    response = client.get("/api/v1/news/news", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_read_news_fields_projection(test_articles):
+    response = client.get("/api/v1/news/news", params={"fields": "title,time"})
+    assert response.status_code == 200
+    news = response.json()[0]
+    assert set(news) == {"id", "title", "time", "upvotes", "is_upvoted"}
+
+    response = client.get("/api/v1/news/news", params={"fields": "title,password"})
+    assert response.status_code == 400
+
+
+def test_read_news_article(test_articles):
+    response = client.get(f"/api/v1/news/news/{test_articles[0].id}")
+    assert response.status_code == 200
+    assert response.json()["content"] == "This is test content 1"
+
+    response = client.get("/api/v1/news/news/999999")
+    assert response.status_code == 404
+
+
+def test_news_published_at(test_articles):
+    assert test_articles[1].published_at == datetime(2024, 1, 2)
+    assert parse_news_time("2024-07-02 21:44") == datetime(2024, 7, 2, 21, 44)
+    assert parse_news_time("2024/1/10 08:00") > parse_news_time("2024/1/9 23:00")
+    assert parse_news_time("yesterday") is None
+    # the migration and new inserts share this fallback
+    before = datetime.now()
+    assert before <= news_published_at("yesterday") <= datetime.now()
+
+
 def mock_openai(mocker, return_content):
-    mock_openai_client = mocker.patch('main.OpenAI')
+    mock_openai_client = mocker.patch('main.get_openai_client')
 
     mock_message = Mock()
     mock_message.content = return_content
@@ -124,6 +189,18 @@ def mock_openai(mocker, return_content):
 
     return mock_openai_client
 
+
+ARTICLE_HTML = """
+<html>
+<h1 class="article-content__title">Test Title</h1>
+<time class="article-content__time">2024-09-10</time>
+<section class="article-content__editor">
+    <p>This is a test paragraph.</p>
+</section>
+</html>
+"""
+
+
 def test_search_news(mocker):
     mock_openai(mocker, "keywords")
 
@@ -131,17 +208,7 @@ def test_search_news(mocker):
         {"titleLink": "http://example.com/news1"}
     ])
 
-    mock_get = mocker.patch("main.requests.get", return_value=mocker.Mock(
-        text="""
-        <html>
-        <h1 class="article-content__title">Test Title</h1>
-        <time class="article-content__time">2024-09-10</time>
-        <section class="article-content__editor">
-            <p>This is a test paragraph.</p>
-        </section>
-        </html>
-        """
-    ))
+    mock_fetch = mocker.patch("main.fetch_article_html", return_value=ARTICLE_HTML)
 
     request_body = {"prompt": "Test search prompt"}
 
@@ -154,6 +221,77 @@ def test_search_news(mocker):
     assert data[0]["title"] == "Test Title"
     assert data[0]["time"] == "2024-09-10"
     assert data[0]["content"] == "This is a test paragraph."
+    mock_fetch.assert_called_once_with("http://example.com/news1")
+
+
+def test_search_news_skips_failed_articles(mocker):
+    mock_openai(mocker, "keywords")
+
+    mocker.patch("main.get_new_info", return_value=[
+        {"titleLink": "http://example.com/news1"},
+        {"titleLink": "http://example.com/news2"},
+    ])
+
+    async def fake_fetch(url):
+        if url.endswith("news1"):
+            raise httpx.ConnectTimeout("timeout")
+        return ARTICLE_HTML
+
+    mocker.patch("main.fetch_article_html", side_effect=fake_fetch)
+
+    response = client.post("/api/v1/news/search_news", json={"prompt": "Test search prompt"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["url"] == "http://example.com/news2"
+
+
+def test_search_news_streams_ndjson(mocker):
+    mock_openai(mocker, "keywords")
+    mocker.patch("main.get_new_info", return_value=[
+        {"titleLink": "http://example.com/news1"},
+        {"titleLink": "http://example.com/news2"},
+    ])
+
+    async def fake_fetch(url):
+        return ARTICLE_HTML.replace("2024-09-10", "2024-09-11" if url.endswith("2") else "2024-09-10")
+
+    mocker.patch("main.fetch_article_html", side_effect=fake_fetch)
+
+    response = client.post(
+        "/api/v1/news/search_news", params={"stream": "ndjson"}, json={"prompt": "Test search prompt"}
+    )
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["event"] for e in events] == ["article", "article", "done"]
+    articles = {e["data"]["url"]: e["data"] for e in events[:2]}
+    assert events[2]["data"] == {
+        "sort": "time desc",
+        "order": [articles["http://example.com/news2"]["id"], articles["http://example.com/news1"]["id"]],
+    }
+
+
+def test_search_news_streams_sse(mocker):
+    mock_openai(mocker, "keywords")
+    mocker.patch("main.get_new_info", return_value=[{"titleLink": "http://example.com/news1"}])
+    mocker.patch("main.fetch_article_html", return_value=ARTICLE_HTML)
+
+    response = client.post(
+        "/api/v1/news/search_news", params={"stream": "sse"}, json={"prompt": "Test search prompt"}
+    )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    article, done = response.text.strip().split("\n\n")
+    assert article.startswith("event: article\ndata: ")
+    assert json.loads(article.split("data: ", 1)[1])["title"] == "Test Title"
+    assert done.startswith("event: done\n")
+
+    response = client.post(
+        "/api/v1/news/search_news", params={"stream": "xml"}, json={"prompt": "Test search prompt"}
+    )
+    assert response.status_code == 422
 
 
 def test_news_summary(mocker, test_token):
@@ -170,13 +308,71 @@ def test_news_summary(mocker, test_token):
     assert json_response["reason"] == "test reason"
 
 
+def test_news_summary_does_not_cache_malformed_answers(mocker, test_token, llm_cache):
+    headers = {"Authorization": f"Bearer {test_token}"}
+    mock_openai(mocker, "sorry, I cannot")
+
+    response = client.post("/api/v1/news/news_summary", json={"content": "Test news content"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {}
+    assert llm_cache.stats()["entries"] == 0
+
+    mock_openai(mocker, json.dumps({"影響": "test impact", "原因": "test reason"}))
+    response = client.post("/api/v1/news/news_summary", json={"content": "Test news content"}, headers=headers)
+    assert response.json() == {"summary": "test impact", "reason": "test reason"}
+
+
 def test_upvote_article(test_user_and_articles, test_token):
     user, articles = test_user_and_articles
     headers = {"Authorization": f"Bearer {test_token}"}
 
     response = client.post(f"/api/v1/news/{articles[0].id}/upvote", headers=headers)
     assert response.status_code == 200
-    assert response.json()["message"] == "Article upvoted"
+    assert response.json() == {"message": "Article upvoted", "upvotes": 1, "is_upvoted": True}
+
+    response = client.post("/api/v1/news/999999/upvote", headers=headers)
+    assert response.status_code == 404
+
+
+def test_upvote_missing_article_with_foreign_keys_enforced(tmp_path):
+    # postgresql rejects an upvote of a missing article, sqlite only when asked to
+    async_engine = main.create_async_db_engine(f"sqlite:///{tmp_path / 'news.db'}", echo=False)
+    event.listen(
+        async_engine.sync_engine, "connect", lambda connection, record: connection.execute("PRAGMA foreign_keys=ON")
+    )
+
+    async def upvote_missing_article():
+        try:
+            async with async_engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+            async with async_sessionmaker(async_engine)() as db:
+                db.add(User(id=1, username="fk", hashed_password="x"))
+                await db.commit()
+                with pytest.raises(HTTPException) as e:
+                    await main.toggle_upvote(999999, 1, db)
+                return e.value.status_code
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(upvote_missing_article()) == 404
+
+
+def test_read_news_upvote_counts(test_user_and_articles, test_token):
+    user, articles = test_user_and_articles
+    headers = {"Authorization": f"Bearer {test_token}"}
+
+    response = client.get("/api/v1/news/user_news", headers=headers)
+    assert response.status_code == 200
+    by_id = {n["id"]: n for n in response.json()}
+    assert by_id[articles[0].id]["upvotes"] == 1
+    assert by_id[articles[0].id]["is_upvoted"] is True
+    assert by_id[articles[1].id]["upvotes"] == 0
+    assert by_id[articles[1].id]["is_upvoted"] is False
+
+    response = client.get("/api/v1/news/news")
+    by_id = {n["id"]: n for n in response.json()}
+    assert by_id[articles[0].id]["upvotes"] == 1
+    assert by_id[articles[0].id]["is_upvoted"] is False
 
 
 def test_downvote_article(test_user_and_articles, test_token):
@@ -185,4 +381,93 @@ def test_downvote_article(test_user_and_articles, test_token):
 
     response = client.post(f"/api/v1/news/{articles[0].id}/upvote", headers=headers)
     assert response.status_code == 200
-    assert response.json()["message"] == "Upvote removed"
+    assert response.json() == {"message": "Upvote removed", "upvotes": 0, "is_upvoted": False}
+
+    with next(override_session_opener()) as db:
+        assert db.get(NewsArticle, articles[0].id).upvote_count == 0
+        assert db.query(user_news_association_table).count() == 0
+
+
+def test_read_news_cached_with_etag(test_user_and_articles, test_token, feed_cache):
+    user, articles = test_user_and_articles
+    headers = {"Authorization": f"Bearer {test_token}"}
+
+    response = client.get("/api/v1/news/news", params={"fields": "title"})
+    etag = response.headers["ETag"]
+    response = client.get("/api/v1/news/news", params={"fields": "title"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert feed_cache.stats()["hits"] == 1
+
+    # the user feed reuses the cached page with the upvotes of the user applied
+    client.post(f"/api/v1/news/{articles[1].id}/upvote", headers=headers)
+    by_id = {n["id"]: n for n in client.get("/api/v1/news/user_news", params={"fields": "title"}, headers=headers).json()}
+    assert by_id[articles[1].id]["is_upvoted"] is True
+    assert by_id[articles[1].id]["upvotes"] == 1
+
+    response = client.get("/api/v1/news/news", params={"fields": "title"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    by_id = {n["id"]: n for n in response.json()}
+    assert by_id[articles[1].id] == {"id": articles[1].id, "title": "Test News 2", "upvotes": 1, "is_upvoted": False}
+    assert feed_cache.stats()["hits"] == 2
+
+    client.post(f"/api/v1/news/{articles[1].id}/upvote", headers=headers)
+
+
+def test_feed_cache_drops_pages_built_before_invalidation(feed_cache):
+    version = feed_cache.version
+    feed_cache.invalidate()
+    feed_cache.set(("cursor", 1, ("id",)), main.FeedPage([], None), version)
+
+    assert feed_cache.get(("cursor", 1, ("id",))) is None
+
+
+@pytest.fixture(scope="module")
+def chinese_article():
+    with next(override_session_opener()) as db:
+        article = NewsArticle(
+            url="https://example.com/test-news-3",
+            title="雞蛋價格上漲",
+            content="受到天氣影響，雞蛋批發價格本週上漲",
+            time="2024-01-03",
+            summary="蛋價上漲",
+            reason="天氣炎熱產量減少",
+        )
+        db.add(article)
+        db.commit()
+        db.refresh(article)
+        return article
+
+
+def test_search_local_news(test_articles, chinese_article):
+    response = client.get("/api/v1/news/search", params={"q": "content 2"})
+    assert response.status_code == 200
+    assert [n["title"] for n in response.json()] == ["Test News 2"]
+
+    response = client.get("/api/v1/news/search", params={"q": "蛋價"})
+    assert [n["id"] for n in response.json()] == [chinese_article.id]
+
+    response = client.get("/api/v1/news/search", params={"q": "雞蛋 天氣", "fields": "title"})
+    assert response.json() == [
+        {"id": chinese_article.id, "title": "雞蛋價格上漲", "upvotes": 0, "is_upvoted": False}
+    ]
+
+    response = client.get("/api/v1/news/search", params={"q": "豬肉"})
+    assert response.json() == []
+
+
+def test_search_news_answers_from_stored_news(mocker, chinese_article):
+    mock_openai(mocker, "雞蛋")
+    mocker.patch("main.SEARCH_LOCAL_MIN_RESULTS", 1)
+    mock_get_new_info = mocker.patch("main.get_new_info")
+
+    response = client.post("/api/v1/news/search_news", json={"prompt": "我想看雞蛋的新聞"})
+
+    assert response.status_code == 200
+    assert response.json() == [{
+        "id": chinese_article.id,
+        "url": "https://example.com/test-news-3",
+        "title": "雞蛋價格上漲",
+        "time": "2024-01-03",
+        "content": "受到天氣影響，雞蛋批發價格本週上漲",
+    }]
+    mock_get_new_info.assert_not_called()
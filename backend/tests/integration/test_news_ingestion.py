@@ -0,0 +1,371 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+from apscheduler.executors.pool import ThreadPoolExecutor as SchedulerThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+from openai import OpenAI
+from sqlalchemy import create_engine, StaticPool
+from sqlalchemy.orm import sessionmaker
+
+import main
+from article_parser import parse_article_html
+from main import Base, IngestionWatermark, NewsArticle, BATCH_RELEVANCE_SYSTEM_PROMPT, SUMMARY_SYSTEM_PROMPT
+
+
+ARTICLE_HTML = """
+<html>
+<h1 class="article-content__title">{title}</h1>
+<time class="article-content__time">2024-09-10 10:00</time>
+<section class="article-content__editor">
+    <p>{title} content.</p>
+</section>
+</html>
+"""
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """minimal openai compatible chat completions endpoint"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        system_prompt = body["messages"][0]["content"]
+        user_content = body["messages"][1]["content"]
+        self.server.requests.append(system_prompt)
+
+        if system_prompt == BATCH_RELEVANCE_SYSTEM_PROMPT:
+            titles = user_content.split("\n")
+            answer = json.dumps(["high" if "價格" in t else "low" for t in titles])
+        elif system_prompt == SUMMARY_SYSTEM_PROMPT:
+            answer = json.dumps({"影響": "stub impact", "原因": "stub reason"}, ensure_ascii=False)
+        else:
+            answer = "low"
+
+        payload = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def known_urls(monkeypatch):
+    urls = set()
+    monkeypatch.setattr(main, "_known_urls", urls)
+    return urls
+
+
+@pytest.fixture(autouse=True)
+def watermarks():
+    with main.SessionLocal() as session:
+        session.query(IngestionWatermark).delete()
+        session.commit()
+
+
+@pytest.fixture
+def stub_llm(mocker):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    mocker.patch("main.get_openai_client", return_value=client)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_new_batches_relevance_classification(mocker, stub_llm):
+    listing = [
+        {"title": f"{'價格' if i % 2 == 0 else '天氣'} news {i}", "titleLink": f"https://udn.com/news/{i}"}
+        for i in range(25)
+    ]
+    mocker.patch("main.get_new_info", return_value=listing)
+    mocker.patch("main.RELEVANCE_BATCH_SIZE", 10)
+    mocker.patch("main.requests.get", side_effect=lambda url, **kwargs: mocker.Mock(
+        text=ARTICLE_HTML.format(title=url)
+    ))
+    add_news = mocker.patch("main.add_news", return_value=(0, 0))
+
+    main.get_new()
+
+    relevance_requests = [r for r in stub_llm.requests if r == BATCH_RELEVANCE_SYSTEM_PROMPT]
+    summary_requests = [r for r in stub_llm.requests if r == SUMMARY_SYSTEM_PROMPT]
+    assert len(relevance_requests) == 3
+    assert len(summary_requests) == 13
+
+    added = [news for call in add_news.call_args_list for news in call.args[0]]
+    assert sorted(n["url"] for n in added) == sorted(n["titleLink"] for n in listing[::2])
+    assert all(n["summary"] == "stub impact" and n["reason"] == "stub reason" for n in added)
+
+
+def test_get_new_skips_known_urls(mocker, stub_llm, known_urls):
+    listing = [
+        {"title": f"價格 news {i}", "titleLink": f"https://udn.com/news/{i}"}
+        for i in range(3)
+    ]
+    known_urls.add("https://udn.com/news/0")
+    mocker.patch("main.get_new_info", return_value=listing + listing[2:])
+    get = mocker.patch("main.requests.get", side_effect=lambda url, **kwargs: mocker.Mock(
+        text=ARTICLE_HTML.format(title=url)
+    ))
+    add_news = mocker.patch("main.add_news", return_value=(2, 0))
+
+    assert main.get_new() == (2, 0)
+
+    fetched = sorted(call.args[0] for call in get.call_args_list)
+    assert fetched == ["https://udn.com/news/1", "https://udn.com/news/2"]
+    assert len(add_news.call_args.args[0]) == 2
+
+
+def test_add_news_skips_duplicate_urls(monkeypatch, known_urls, feed_cache):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=engine))
+
+    def news(i):
+        return {
+            "url": f"https://udn.com/news/{i}",
+            "title": f"news {i}",
+            "time": "2024-09-10 10:00",
+            "content": ["paragraph 1", "paragraph 2"],
+            "summary": "summary",
+            "reason": "reason",
+        }
+
+    assert main.add_news([news(0)]) == (1, 0)
+    assert main.add_news([news(0), news(1), news(1), news(2)]) == (2, 2)
+    assert main.add_news([news(2)]) == (0, 1)
+    # the feed cache is only cleared by the calls that inserted news
+    assert feed_cache.version == 2
+
+    with sessionmaker(bind=engine)() as session:
+        assert session.query(NewsArticle).count() == 3
+        assert session.query(NewsArticle).first().content == "paragraph 1 paragraph 2"
+    assert known_urls == {f"https://udn.com/news/{i}" for i in range(3)}
+
+
+def test_classify_relevance_falls_back_to_single_requests(mocker):
+    answers = iter(["not json", "high", "low"])
+    mocker.patch("main.chat_completion", side_effect=lambda *args, **kwargs: next(answers))
+
+    assert main.classify_relevance_batch(["a", "b"]) == ["high", "low"]
+
+
+def test_classify_relevance_batch_caches_only_matching_answers(mocker, llm_cache):
+    create = mocker.patch("main.get_openai_client").return_value.chat.completions.create
+    answers = iter(['["high"]', "high", "low", '["high", "low"]'])
+    create.side_effect = lambda **kwargs: mocker.Mock(choices=[mocker.Mock(message=mocker.Mock(content=next(answers)))])
+
+    assert main.classify_relevance_batch(["a", "b"]) == ["high", "low"]
+    # the short batch answer was not cached, asking again reaches the llm
+    assert main.classify_relevance_batch(["a", "b"]) == ["high", "low"]
+    assert create.call_count == 4
+    assert main.classify_relevance_batch(["a", "b"]) == ["high", "low"]
+    assert create.call_count == 4
+
+
+def test_get_new_reuses_cached_llm_responses(mocker, stub_llm, llm_cache):
+    listing = [
+        {"title": f"價格 news {i}", "titleLink": f"https://udn.com/news/{i}"}
+        for i in range(3)
+    ]
+    mocker.patch("main.get_new_info", return_value=listing)
+    mocker.patch("main.requests.get", side_effect=lambda url, **kwargs: mocker.Mock(
+        text=ARTICLE_HTML.format(title=url)
+    ))
+    mocker.patch("main.add_news", return_value=(0, 0))
+
+    main.get_new()
+    first_run_requests = len(stub_llm.requests)
+    main.get_new()
+
+    assert first_run_requests == 4
+    assert len(stub_llm.requests) == first_run_requests
+    assert llm_cache.stats()["hits"] == 6
+
+
+def test_llm_cache_evicts_least_recently_used(llm_cache):
+    llm_cache.max_entries = 2
+    llm_cache.set("model", "system", "a", "A")
+    llm_cache.set("model", "system", "b", "B")
+    assert llm_cache.get("model", "system", "a") == "A"
+    llm_cache.set("model", "system", "c", "C")
+
+    assert llm_cache.get("model", "system", "b") is None
+    assert llm_cache.get("model", "system", "a") == "A"
+    assert llm_cache.get("model", "other system", "a") is None
+    assert llm_cache.stats()["entries"] == 2
+
+
+def test_llm_cache_expires_entries(llm_cache):
+    llm_cache.set("model", "system", "a", "A")
+    llm_cache.ttl = timedelta(seconds=-1)
+
+    assert llm_cache.get("model", "system", "a") is None
+    assert llm_cache.stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0, "entries": 0}
+
+
+def listing_item(i):
+    return {"title": f"價格 news {i}", "titleLink": f"https://udn.com/news/{i}"}
+
+
+def test_get_new_info_pages_until_watermark(mocker):
+    pages = {1: [listing_item(i) for i in (9, 8, 7)], 2: [listing_item(i) for i in (6, 5, 4)]}
+    fetch = mocker.patch("main.fetch_listing_page", side_effect=lambda term, page: pages.get(page, []))
+
+    news = main.get_new_info("價格", watermark="https://udn.com/news/5")
+
+    assert [n["titleLink"] for n in news] == [f"https://udn.com/news/{i}" for i in (9, 8, 7, 6)]
+    assert fetch.call_count == 2
+
+    fetch.reset_mock()
+    assert len(main.get_new_info("價格", watermark="https://udn.com/news/gone")) == 6
+    assert fetch.call_count == 3
+
+
+def test_get_new_only_reads_items_newer_than_the_watermark(mocker, stub_llm, monkeypatch):
+    monkeypatch.setattr(main, "INGEST_BACKFILL_PAGES", 2)
+    pages = {1: [listing_item(i) for i in (3, 2)], 2: [listing_item(i) for i in (1, 0)]}
+    fetch = mocker.patch("main.fetch_listing_page", side_effect=lambda term, page: pages.get(page, []))
+    mocker.patch("main.requests.get", side_effect=lambda url, **kwargs: mocker.Mock(
+        text=ARTICLE_HTML.format(title=url)
+    ))
+    add_news = mocker.patch("main.add_news", return_value=(0, 0))
+
+    main.get_new()
+    assert fetch.call_count == 2
+    assert len(add_news.call_args.args[0]) == 4
+    assert main.get_watermark("價格") == "https://udn.com/news/3"
+
+    fetch.reset_mock()
+    pages[1], pages[2] = [listing_item(4), listing_item(3)], [listing_item(2)]
+    main.get_new()
+    assert fetch.call_count == 1
+    assert [n["url"] for n in add_news.call_args.args[0]] == ["https://udn.com/news/4"]
+    assert main.get_watermark("價格") == "https://udn.com/news/4"
+
+
+def test_schedule_ingestion_adds_one_job_per_term():
+    main.set_watermark("雞蛋", "https://udn.com/news/1")
+    scheduler = BackgroundScheduler(executors={"ingestion": SchedulerThreadPoolExecutor(1)})
+    scheduler.start(paused=True)
+    try:
+        main.schedule_ingestion(scheduler, ["價格", "雞蛋"])
+        jobs = {job.id: job for job in scheduler.get_jobs()}
+    finally:
+        scheduler.shutdown(wait=False)
+
+    assert sorted(jobs) == ["ingest:價格", "ingest:雞蛋"]
+    assert jobs["ingest:價格"].kwargs == {"search_term": "價格"}
+    assert jobs["ingest:價格"].trigger.jitter == main.INGEST_JITTER_SECONDS
+    # no watermark yet, backfilled right away in the background
+    now = datetime.now(jobs["ingest:價格"].next_run_time.tzinfo)
+    assert jobs["ingest:價格"].next_run_time <= now
+    assert jobs["ingest:雞蛋"].next_run_time > now + timedelta(minutes=main.INGEST_INTERVAL_MINUTES - 10)
+    assert main.bgs._job_defaults["max_instances"] == 1
+    assert main.bgs._job_defaults["coalesce"] is True
+
+
+def test_schedule_search_index_sync_runs_once_in_the_background():
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    try:
+        main.schedule_search_index_sync(scheduler)
+        job = scheduler.get_job("sync_search_index")
+    finally:
+        scheduler.shutdown(wait=False)
+
+    assert job.func is main.sync_search_index
+    assert isinstance(job.trigger, DateTrigger)
+    assert job.next_run_time <= datetime.now(job.next_run_time.tzinfo)
+
+
+def test_parse_article_html_fixture_pages():
+    fixtures = Path(__file__).resolve().parent.parent / "fixtures"
+
+    title, time, paragraphs = parse_article_html((fixtures / "udn_article_cpi.html").read_text(encoding="utf-8"))
+
+    assert title == "8月CPI年增2.36% 外食費漲幅居高不下"
+    assert time == "2024-09-06 16:20"
+    assert len(paragraphs) == 10
+    assert paragraphs[:2] == ["廣告", "物價觀察：物價連續三個月上揚。"]
+    assert all("▪" not in p and p.strip() for p in paragraphs)
+
+    with pytest.raises(ValueError):
+        parse_article_html("<html><h1>not udn</h1></html>")
+
+
+def test_get_new_isolates_failing_articles(mocker, stub_llm, monkeypatch):
+    monkeypatch.setattr(main, "INGEST_RETRY_BACKOFF", 0)
+    mocker.patch("main.get_new_info", return_value=[listing_item(i) for i in range(3)])
+    attempts = {}
+
+    def fake_get(url, **kwargs):
+        attempts[url] = attempts.get(url, 0) + 1
+        if url.endswith("/1"):
+            return mocker.Mock(text="<html><p>not an article</p></html>")
+        if url.endswith("/2") and attempts[url] == 1:
+            raise requests.ConnectionError("reset")
+        return mocker.Mock(text=ARTICLE_HTML.format(title=url))
+
+    mocker.patch("main.requests.get", side_effect=fake_get)
+    add_news = mocker.patch("main.add_news", return_value=(2, 0))
+
+    assert main.get_new() == (2, 0)
+
+    assert sorted(n["url"] for n in add_news.call_args.args[0]) == [
+        "https://udn.com/news/0", "https://udn.com/news/2"
+    ]
+    # the parse failure is not retried, the connection error is
+    assert attempts == {"https://udn.com/news/0": 1, "https://udn.com/news/1": 1, "https://udn.com/news/2": 2}
+    # a page without an article is not read again
+    assert main.get_watermark("價格") == "https://udn.com/news/0"
+
+
+def test_get_new_reads_failed_articles_again(mocker, stub_llm, monkeypatch, known_urls):
+    monkeypatch.setattr(main, "INGEST_BACKFILL_PAGES", 1)
+    monkeypatch.setattr(main, "INGEST_RETRIES", 0)
+    pages = {1: [listing_item(i) for i in (3, 2, 1, 0)]}
+    mocker.patch("main.fetch_listing_page", side_effect=lambda term, page: pages.get(page, []))
+    outage = {"https://udn.com/news/2"}
+
+    def fake_get(url, **kwargs):
+        if url in outage:
+            raise requests.ConnectionError("reset")
+        return mocker.Mock(text=ARTICLE_HTML.format(title=url))
+
+    def fake_add_news(news_list):
+        known_urls.update(n["url"] for n in news_list)
+        return len(news_list), 0
+
+    mocker.patch("main.requests.get", side_effect=fake_get)
+    mocker.patch("main.add_news", side_effect=fake_add_news)
+
+    assert main.get_new() == (3, 0)
+    assert main.get_watermark("價格") == "https://udn.com/news/1"
+
+    outage.clear()
+    pages[1] = [listing_item(i) for i in (4, 3, 2, 1, 0)]
+    assert main.get_new() == (2, 0)
+    assert known_urls == {f"https://udn.com/news/{i}" for i in range(5)}
+    assert main.get_watermark("價格") == "https://udn.com/news/4"
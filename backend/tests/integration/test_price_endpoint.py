@@ -1,10 +1,25 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch
+import main
 from main import app
+from compression import negotiate_encoding
+from price_store import NecessitiesPriceStore
 
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def price_store(monkeypatch):
+    store = NecessitiesPriceStore()
+    monkeypatch.setattr(main, "price_store", store)
+    return store
+
+
 @pytest.fixture
 def mock_necessities_data():
     return [
@@ -55,10 +70,61 @@ def test_get_necessities_prices_with_query(mock_get, mock_necessities_data):
 
     assert response.status_code == 200
     data = response.json()
-    assert len(data) == 2
+    assert len(data) == 1
     assert data[0]["類別"] == "鮮乳"
     assert data[0]["產品名稱"] == "統一瑞穗高優質鮮乳"
 
+    response = client.get("/api/v1/prices/necessities-price", params={"category": "米"})
+    assert response.json() == []
+    assert mock_get.call_count == 1
+
+
+@patch("main.requests.get")
+def test_get_necessities_prices_etag(mock_get, mock_necessities_data):
+    mock_get.return_value.json.return_value = mock_necessities_data
+
+    response = client.get("/api/v1/prices/necessities-price")
+    etag = response.headers["ETag"]
+
+    response = client.get("/api/v1/prices/necessities-price", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("/api/v1/prices/necessities-price", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+
+def test_price_store_refresh_from_fixture_server(price_store, mock_necessities_data):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        dataset = mock_necessities_data
+
+        def do_GET(self):
+            payload = json.dumps(self.dataset, ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        price_store.url = f"http://127.0.0.1:{server.server_port}/NecessitiesPrice"
+        price_store.refresh()
+        first_etag = price_store.snapshot.etag
+        assert len(price_store.snapshot.query(commodity="味全林鳳營鮮乳")) == 1
+
+        FixtureHandler.dataset = mock_necessities_data[:1]
+        price_store.refresh()
+        assert price_store.snapshot.etag != first_etag
+        assert len(price_store.snapshot.query(category="鮮乳")) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
 
 # @patch("main.requests.get")
 # def test_get_necessities_prices_error_handling(mock_get):
@@ -69,4 +135,122 @@ def test_get_necessities_prices_with_query(mock_get, mock_necessities_data):
 #     response = client.get("/api/v1/prices/necessities-price")
 
 #     assert response.status_code == 400
-#     assert response.json()["detail"] == "Error fetching data"
\ No newline at end of file
+#     assert response.json()["detail"] == "Error fetching data"
+
+@patch("main.requests.get")
+def test_get_price_series(mock_get, mock_necessities_data):
+    mock_get.return_value.json.return_value = mock_necessities_data
+
+    response = client.get("/api/v1/prices/series", params={"commodity": "統一瑞穗高優質鮮乳"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["編號"] == 1
+    assert data[0]["periods"][:2] == ["2015-03", "2015-04"]
+    assert data[0]["values"] == [144, 143, 143, 143, 143, None, None, 145, 145, 146, 146]
+    assert "統計值" not in data[0]
+
+
+@patch("main.requests.get")
+def test_get_product_price_series_range_and_resolution(mock_get, mock_necessities_data):
+    mock_get.return_value.json.return_value = mock_necessities_data
+
+    response = client.get("/api/v1/prices/series/1", params={"start": "2015-07", "end": "2015-12"})
+    assert response.json()["periods"] == ["2015-07", "2015-08", "2015-09", "2015-10", "2015-11", "2015-12"]
+    assert response.json()["values"] == [143, None, None, 145, 145, 146]
+
+    response = client.get("/api/v1/prices/series/1", params={"resolution": "quarter"})
+    assert response.json()["periods"] == ["2015-Q1", "2015-Q2", "2015-Q3", "2015-Q4", "2016-Q1"]
+    assert response.json()["values"] == [144, 143, 143, 145.33, 146]
+
+    response = client.get("/api/v1/prices/series/1", params={"resolution": "week"})
+    assert response.status_code == 422
+
+    response = client.get("/api/v1/prices/series/999")
+    assert response.status_code == 404
+
+
+@patch("main.requests.get")
+def test_get_price_trends(mock_get, mock_necessities_data):
+    mock_get.return_value.json.return_value = mock_necessities_data
+
+    response = client.get("/api/v1/prices/trends", params={"category": "鮮乳"})
+
+    assert response.status_code == 200
+    data = response.json()
+    products = {p["編號"]: p for p in data["products"]}
+    assert products[1]["last_month"] == "2016-01"
+    assert products[1]["latest"] == 146
+    assert products[1]["mom_pct"] == 0
+    assert products[1]["rolling_mean"] == 145.67
+    assert products[2]["mom_pct"] == -2.11
+    assert products[2]["yoy_pct"] is None
+    assert data["top_movers"]["鮮乳"]["gainers"] == []
+    assert [p["編號"] for p in data["top_movers"]["鮮乳"]["losers"]] == [2]
+
+    response = client.get("/api/v1/prices/trends", params={"category": "米"})
+    assert response.json()["products"] == []
+
+
+def test_price_trends_cached_per_snapshot(price_store, mock_necessities_data):
+    price_store.load(mock_necessities_data)
+    snapshot = price_store.snapshot
+    assert snapshot.trends() is snapshot.trends()
+
+    price_store.load(mock_necessities_data)
+    assert price_store.snapshot.trends() is not snapshot.trends()
+
+
+@pytest.fixture
+def large_necessities_data(mock_necessities_data):
+    return [
+        {**item, "編號": i, "產品名稱": f"{item['產品名稱']} {i}"}
+        for i, item in enumerate(mock_necessities_data * 40)
+    ]
+
+
+def test_price_dataset_compressed_once(price_store, large_necessities_data):
+    price_store.load(large_necessities_data)
+
+    response = client.get("/api/v1/prices/necessities-price", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert len(response.json()) == 80
+
+    body = price_store.snapshot.response_body("items", None)
+    compressed, _ = body.get("br")
+    client.get("/api/v1/prices/necessities-price", headers={"Accept-Encoding": "br"})
+    assert body.get("br")[0] is compressed
+
+    response = client.get("/api/v1/prices/necessities-price", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 80
+
+    response = client.get("/api/v1/prices/necessities-price", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 80
+
+
+def test_responses_compressed_above_threshold(price_store, mock_necessities_data, large_necessities_data):
+    price_store.load(large_necessities_data)
+    response = client.get(
+        "/api/v1/prices/series", params={"category": "鮮乳"}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 80
+
+    price_store.load(mock_necessities_data)
+    response = client.get(
+        "/api/v1/prices/series/1", params={"end": "2015-04"}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert "content-encoding" not in response.headers
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("br;q=0.5, gzip") == "gzip"
+    assert negotiate_encoding("gzip, br;q=0") == "gzip"
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding(None) is None
@@ -1,11 +1,15 @@
 import pytest
+from datetime import timedelta
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, StaticPool
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 from main import app
 from main import Base, User, session_opener
 from jose import jwt
-from main import pwd_context
+from main import pwd_context, PasswordHasher
+import main
 
 SECRET_KEY = "1892dhianiandowqd0n"
 ALGORITHM = "HS256"
@@ -26,7 +30,17 @@ def override_session_opener():
         db.close()
 
 
-app.dependency_overrides[session_opener] = override_session_opener
+# a new event loop serves every TestClient request, so connections are not pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def override_async_session_opener():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+app.dependency_overrides[session_opener] = override_async_session_opener
 
 client = TestClient(app)
 
@@ -63,6 +77,7 @@ def test_register_user():
     assert response.status_code == 200
     data = response.json()
     assert data["username"] == "newuser"
+    assert "hashed_password" not in data
 
 
 def test_login_for_access_token(test_user):
@@ -83,4 +98,63 @@ def test_read_users_me(test_token):
 
     assert response.status_code == 200
     data = response.json()
-    assert data["username"] == "testuser"
\ No newline at end of file
+    assert data["username"] == "testuser"
+
+def test_login_is_shed_when_password_hasher_is_saturated(monkeypatch, test_user):
+    hasher = PasswordHasher(pwd_context, workers=1, max_queue=0)
+    monkeypatch.setattr(main, "password_hasher", hasher)
+    hasher.pending = 1
+
+    response = client.post("/api/v1/users/login", data={
+        "username": "testuser",
+        "password": "testpassword"
+    })
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/api/v1/stats/password-hasher").json() == {
+        "workers": 1, "in_progress": 1, "queue_depth": 0, "max_queue": 0, "rejected": 1
+    }
+
+    hasher.pending = 0
+    response = client.post("/api/v1/users/login", data={
+        "username": "testuser",
+        "password": "testpassword"
+    })
+    assert response.status_code == 200
+    assert hasher.stats()["in_progress"] == 0
+
+
+def test_read_users_me_uses_auth_cache(mocker, test_token, auth_user_cache):
+    headers = {"Authorization": f"Bearer {test_token}"}
+    lookup = mocker.spy(main, "get_user_by_username")
+
+    assert client.get("/api/v1/users/me", headers=headers).json() == {"username": "testuser"}
+    assert client.get("/api/v1/users/me", headers=headers).json() == {"username": "testuser"}
+
+    assert lookup.call_count == 1
+    assert client.get("/api/v1/stats/auth-cache").json() == {
+        "hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1
+    }
+
+
+def test_auth_cache_is_invalidated_on_user_change(test_user, auth_user_cache):
+    auth_user_cache.set(main.AuthenticatedUser(test_user.id, "testuser"))
+
+    with next(override_session_opener()) as db:
+        user = db.get(User, test_user.id)
+        user.hashed_password = pwd_context.hash("testpassword")
+        db.commit()
+
+    assert auth_user_cache.get("testuser") is None
+
+
+def test_auth_cache_expires_and_evicts(auth_user_cache):
+    auth_user_cache.max_entries = 1
+    auth_user_cache.set(main.AuthenticatedUser(1, "a"))
+    auth_user_cache.set(main.AuthenticatedUser(2, "b"))
+    assert auth_user_cache.get("a") is None
+    assert auth_user_cache.get("b").id == 2
+
+    auth_user_cache.ttl = timedelta(seconds=-1)
+    assert auth_user_cache.get("b") is None
@@ -2,49 +2,116 @@ import { defineStore } from 'pinia';
 import axios from 'axios';
 import { useAuthStore } from './auth';
 
+const NEWS_PAGE_SIZE = 50;
+const NEWS_LIST_FIELDS = 'url,title,time,summary';
+
 export const useNewsStore = defineStore('news', {
     state: () => ({
         newsList: [],
+        nextCursor: null,
         isLoading: false,
+        isLoadingMore: false,
         errorMessage: '',
     }),
     actions: {
-        async fetchNews() {
-            this.isLoading = true;
-            this.errorMessage = '';
+        async fetchNewsPage(cursor) {
             const authStore = useAuthStore();
             const apiUrl = authStore.isLoggedIn 
                 ? 'http://localhost:8000/api/v1/news/user_news'
                 : 'http://localhost:8000/api/v1/news/news';
+            // the full text is only loaded when an article is opened, see fetchNewsContent
+            const params = { limit: NEWS_PAGE_SIZE, fields: NEWS_LIST_FIELDS };
+            if (cursor) params.cursor = cursor;
+            const response = await axios.get(apiUrl, {
+                params,
+                headers: authStore.isLoggedIn ? { Authorization: `Bearer ${authStore.accessToken}` } : {}
+            });
+            this.nextCursor = response.headers['x-next-cursor'] || null;
+            return response.data.map(news => ({ ...news, isSummaryLoading: false }));
+        },
+        async fetchNews() {
+            this.isLoading = true;
+            this.errorMessage = '';
+            this.nextCursor = null;
             try {
-                const response = await axios.get(apiUrl,
-                    { headers: authStore.isLoggedIn ? { Authorization: `Bearer ${authStore.accessToken}` } : {}
-                });
-                this.newsList = response.data.map(news => ({ ...news, isSummaryLoading: false }));
+                this.newsList = await this.fetchNewsPage(null);
             } catch (error) {
                 this.errorMessage = 'Error fetching news: ' + error.message;
             } finally {
                 this.isLoading = false;
             }
         },
+        async fetchMoreNews() {
+            if (this.isLoadingMore || !this.nextCursor) return;
+            this.isLoadingMore = true;
+            this.errorMessage = '';
+            try {
+                this.newsList.push(...await this.fetchNewsPage(this.nextCursor));
+            } catch (error) {
+                this.errorMessage = 'Error fetching news: ' + error.message;
+            } finally {
+                this.isLoadingMore = false;
+            }
+        },
+        async fetchNewsContent(newsId) {
+            const news = this.newsList.find(news => news.id === newsId);
+            if (!news || news.content) return;
+            try {
+                const response = await axios.get(`http://localhost:8000/api/v1/news/news/${newsId}`);
+                news.content = response.data.content;
+                news.reason = response.data.reason;
+            } catch (error) {
+                this.errorMessage = 'Error fetching news: ' + error.message;
+            }
+        },
         async promptSearchNews(prompt) {
             if(this.isLoading) return;
             this.isLoading = true;
             this.errorMessage = '';
+            this.newsList = [];
+            this.nextCursor = null;
             try {
-                const response = await axios.post('http://localhost:8000/api/v1/news/search_news', {prompt: prompt});
-                this.newsList = response.data.map(news => ({ ...news, isSummaryLoading: false }));
+                // ndjson stream: one "article" event per result, then "done" with the final order
+                const response = await fetch('http://localhost:8000/api/v1/news/search_news?stream=ndjson', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({prompt: prompt}),
+                });
+                if (!response.ok) throw new Error(`Request failed with status code ${response.status}`);
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                for (;;) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => this.handleSearchEvent(JSON.parse(line)));
+                }
             } catch (error) {
                 this.errorMessage = 'Error fetching news: ' + error.message;
             } finally {
                 this.isLoading = false;
             }            
         },
+        handleSearchEvent({ event, data }) {
+            if (event === 'article') {
+                this.newsList.push({ ...data, isSummaryLoading: false });
+            } else if (event === 'done') {
+                const rank = new Map(data.order.map((id, i) => [id, i]));
+                this.newsList.sort((a, b) => rank.get(a.id) - rank.get(b.id));
+            }
+        },
         async fetchNewsSummary(content, index) {
             if(this.newsList[index].isSummaryLoading) return;
             this.newsList[index].isSummaryLoading = true;
             this.errorMessage = '';
             try {
+                if (!content) {
+                    await this.fetchNewsContent(this.newsList[index].id);
+                    content = this.newsList[index].content;
+                }
                 const response = await axios.post('http://localhost:8000/api/v1/news/news_summary', {content: content});
                 if (response.data && index >= 0 && index < this.newsList.length) {
                     this.newsList[index].reason = response.data.reason;